@@ -0,0 +1,16 @@
+# energy/management/commands/rebuild_cumulative_calories.py
+from django.core.management.base import BaseCommand
+
+from energy.utils import bump_data_version, rebuild_cumulative_calories
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute UserProfile cumulative intake/expenditure from all rows, "
+        "e.g. after QuerySet.update() or an unmuted bulk_create."
+    )
+
+    def handle(self, *args, **options):
+        rebuild_cumulative_calories()
+        bump_data_version()
+        self.stdout.write(self.style.SUCCESS("Rebuilt cumulative calorie totals."))
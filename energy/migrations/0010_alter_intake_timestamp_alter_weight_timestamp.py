@@ -0,0 +1,28 @@
+# Generated by Django 5.0.3 on 2026-10-15 04:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("energy", "0009_rename_previous_day_surplus_calories_userprofile_adjustment"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="intake",
+            name="timestamp",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+        migrations.AlterField(
+            model_name="weight",
+            name="timestamp",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.3 on 2026-10-15 04:35
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_cumulative_calories(apps, schema_editor):
+    Intake = apps.get_model("energy", "Intake")
+    Expenditure = apps.get_model("energy", "Expenditure")
+    UserProfile = apps.get_model("energy", "UserProfile")
+    UserProfile.objects.update(
+        cumulative_intake=Intake.objects.aggregate(s=Sum("calories"))["s"] or 0,
+        cumulative_expenditure=Expenditure.objects.aggregate(s=Sum("calories"))["s"]
+        or 0,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("energy", "0010_alter_intake_timestamp_alter_weight_timestamp"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="cumulative_expenditure",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="userprofile",
+            name="cumulative_intake",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_cumulative_calories, migrations.RunPython.noop),
+    ]
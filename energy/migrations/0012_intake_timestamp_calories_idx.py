@@ -0,0 +1,25 @@
+# Generated by Django 5.0.3 on 2026-10-15 04:39
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("energy", "0011_userprofile_cumulative_calories"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="intake",
+            name="timestamp",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="intake",
+            index=models.Index(
+                fields=["timestamp", "calories"], name="intake_timestamp_calories_idx"
+            ),
+        ),
+    ]
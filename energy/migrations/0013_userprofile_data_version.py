@@ -0,0 +1,19 @@
+# Generated by Django 5.0.3 on 2026-10-15 05:08
+
+import time
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("energy", "0012_intake_timestamp_calories_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="data_version",
+            field=models.BigIntegerField(default=time.time_ns),
+        ),
+    ]
@@ -1,11 +1,35 @@
 # energy/models.py
+import time
+
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import post_delete, post_save
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 
-from energy.utils import update_remaining_calories_adjustment
+from energy.utils import (
+    bump_data_version,
+    energy_signals_muted,
+    invalidate_user_profile_cache,
+    rebuild_cumulative_calories,
+    record_calorie_change,
+    update_remaining_calories_adjustment,
+)
+
+_MONTHS = (
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+)
 
 
 class UserProfile(models.Model):
@@ -13,25 +37,27 @@ class UserProfile(models.Model):
     goal_weight = models.IntegerField(default=-1)
     goal_daily_calorie_delta = models.IntegerField(default=0)
     adjustment = models.IntegerField(default=0)
+    cumulative_intake = models.BigIntegerField(default=0)
+    cumulative_expenditure = models.BigIntegerField(default=0)
+    # Seeded from the clock so a recreated profile never reuses an old key.
+    data_version = models.BigIntegerField(default=time.time_ns)
 
     def __str__(self):
         return self.user.username
 
 
-# Signal to create or update user profile
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def clear_user_profile_cache(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_user_profile_cache)
+
+
+# Signal to create user profile
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
+def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
-    else:
-        profile, was_created = UserProfile.objects.get_or_create(
-            user=instance,
-            defaults={
-                "goal_weight": -1,
-                "goal_daily_calorie_delta": 0,
-                "previous_day_surplus_calories": 0,
-            },
-        )
+        rebuild_cumulative_calories()
 
 
 class Intake(models.Model):
@@ -44,11 +70,12 @@ class Intake(models.Model):
 
     class Meta:
         verbose_name_plural = "Intakes"
-
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        date = timezone.localtime(self.timestamp).date()
-        update_remaining_calories_adjustment(date)
+        indexes = [
+            # Covers the per-day SUM(calories) range aggregates.
+            models.Index(
+                fields=["timestamp", "calories"], name="intake_timestamp_calories_idx"
+            ),
+        ]
 
 
 class Expenditure(models.Model):
@@ -56,32 +83,60 @@ class Expenditure(models.Model):
     date = models.DateField(unique=True)
 
     def __str__(self):
-        formatted_date = self.date.strftime("%b %-d")
+        formatted_date = f"{_MONTHS[self.date.month - 1]} {self.date.day}"
         return f"{formatted_date} - {self.calories} cal"
 
     class Meta:
         verbose_name_plural = "Expenditures"
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        update_remaining_calories_adjustment(self.date)
+
+@receiver(pre_save, sender=Intake)
+@receiver(pre_save, sender=Expenditure)
+def remember_saved_calories(sender, instance, **kwargs):
+    if energy_signals_muted.get():
+        return
+    saved_calories = None
+    if instance.pk is not None:
+        saved_calories = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list("calories", flat=True)
+            .first()
+        )
+    instance._saved_calories = saved_calories or 0
+
+
+def apply_calorie_change(sender, instance, signal):
+    if signal is post_delete:
+        calories_change = -instance.calories
+    else:
+        calories_change = instance.calories - instance._saved_calories
+    if calories_change:
+        record_calorie_change(sender, calories_change)
 
 
 @receiver(post_save, sender=Intake)
 @receiver(post_delete, sender=Intake)
+def update_intake_adjustment(sender, instance, signal, **kwargs):
+    if energy_signals_muted.get():
+        return
+    apply_calorie_change(sender, instance, signal)
+    bump_data_version()
+    update_remaining_calories_adjustment(timezone.localtime(instance.timestamp).date())
+
+
 @receiver(post_save, sender=Expenditure)
 @receiver(post_delete, sender=Expenditure)
-def update_surplus_calories(sender, instance, **kwargs):
-    if hasattr(instance, "date"):
-        update_date = instance.date
-    else:
-        update_date = timezone.localtime(instance.timestamp).date()
-    update_remaining_calories_adjustment(update_date)
+def update_expenditure_adjustment(sender, instance, signal, **kwargs):
+    if energy_signals_muted.get():
+        return
+    apply_calorie_change(sender, instance, signal)
+    bump_data_version()
+    update_remaining_calories_adjustment(instance.date)
 
 
 class Weight(models.Model):
     weight = models.FloatField()
-    timestamp = models.DateTimeField(default=timezone.now)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
 
     def __str__(self):
         return f"{self.weight} lbs"
@@ -0,0 +1,14 @@
+# energy/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class EnergyCursorPagination(CursorPagination):
+    page_size = 100
+
+
+class TimestampCursorPagination(EnergyCursorPagination):
+    ordering = "-timestamp"
+
+
+class DateCursorPagination(EnergyCursorPagination):
+    ordering = "-date"
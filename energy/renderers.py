@@ -0,0 +1,23 @@
+# energy/renderers.py
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    # Fall back to DRF's encoder for types orjson doesn't know (Decimal, lazy
+    # strings, ...).
+    _default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        option = 0
+        # The browsable API asks for indented output; orjson only does 2 spaces.
+        if renderer_context and renderer_context.get("indent"):
+            option = orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=self._default, option=option)
@@ -0,0 +1,30 @@
+# energy/signals.py
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .utils import bump_data_version, energy_signals_muted, rebuild_cumulative_calories
+
+
+@contextmanager
+def mute_energy_signals():
+    """
+    Skip the Intake/Expenditure receivers for saves and deletes made in the
+    current thread or task, then rebuild the cumulative calorie totals and
+    bump the data version once the block's writes commit, e.g.
+
+        with mute_energy_signals():
+            Intake.objects.bulk_create(intakes)
+        update_remaining_calories_adjustment(max_date)
+
+    bulk_create() and QuerySet.update() send no per-row signals at all; for
+    them the block's value is that single rebuild and bump on exit. The
+    rebuild also runs if the block raised outside a transaction.
+    """
+    token = energy_signals_muted.set(True)
+    try:
+        yield
+    finally:
+        energy_signals_muted.reset(token)
+        transaction.on_commit(rebuild_cumulative_calories)
+        transaction.on_commit(bump_data_version)
@@ -1,3 +1,301 @@
-from django.test import TestCase
+import contextvars
+import datetime
+from io import StringIO
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Expenditure, Intake, UserProfile
+from .serializers import IntakeSerializer
+from .signals import mute_energy_signals
+from .utils import (
+    compute_adjustment,
+    date_range_ops,
+    get_data_version,
+    get_user_profile,
+    update_remaining_calories_adjustment,
+)
+
+
+class ComputeAdjustmentTests(SimpleTestCase):
+    def test_behind_deficit_goal(self):
+        self.assertEqual(compute_adjustment(1800, 2000, -500, 2), 800)
+
+    def test_ahead_of_deficit_goal(self):
+        self.assertEqual(compute_adjustment(1500, 2500, -500, 1), -500)
+
+    def test_no_history(self):
+        self.assertEqual(compute_adjustment(0, 0, -500, 0), 0)
+
+
+class DateFromRequestTests(SimpleTestCase):
+    def _request(self, **params):
+        return SimpleNamespace(query_params=params)
+
+    def test_parses_iso_date(self):
+        self.assertEqual(
+            date_range_ops.get_date_from_request(self._request(date="2024-03-01")),
+            datetime.date(2024, 3, 1),
+        )
+
+    def test_rejects_bad_date(self):
+        with self.assertRaisesMessage(ValueError, "Use YYYY-MM-DD"):
+            date_range_ops.get_date_from_request(self._request(date="03/01/2024"))
+
+
+class AdjustmentUpdateTests(TestCase):
+    def setUp(self):
+        User.objects.create(username="tester")
+
+    def _adjustment_updates(self, queries):
+        return [q for q in queries if 'SET "adjustment"' in q["sql"]]
+
+    def test_intake_save_updates_adjustment_once(self):
+        with CaptureQueriesContext(connection) as ctx:
+            Intake.objects.create(label="apple", calories=95)
+        self.assertEqual(len(self._adjustment_updates(ctx.captured_queries)), 1)
+
+    def test_adjustment_covers_history_before_date(self):
+        UserProfile.objects.update(goal_daily_calorie_delta=-500)
+        Expenditure.objects.create(calories=2000, date=datetime.date(2024, 3, 1))
+        Intake.objects.create(
+            label="lunch",
+            calories=1800,
+            timestamp=timezone.make_aware(datetime.datetime(2024, 3, 1, 12)),
+        )
+        update_remaining_calories_adjustment(datetime.date(2024, 3, 3))
+        self.assertEqual(UserProfile.objects.get().adjustment, 800)
+
+    def test_adjustment_goes_negative_when_ahead_of_goal(self):
+        UserProfile.objects.update(goal_daily_calorie_delta=-500)
+        Expenditure.objects.create(calories=2500, date=datetime.date(2024, 3, 1))
+        Intake.objects.create(
+            label="lunch",
+            calories=1500,
+            timestamp=timezone.make_aware(datetime.datetime(2024, 3, 1, 12)),
+        )
+        update_remaining_calories_adjustment(datetime.date(2024, 3, 2))
+        self.assertEqual(UserProfile.objects.get().adjustment, -500)
+
+    def test_evening_first_intake_starts_on_its_local_day(self):
+        UserProfile.objects.update(goal_daily_calorie_delta=-500)
+        # 17:31 in Denver is already the next day in UTC.
+        Intake.objects.create(
+            label="dinner",
+            calories=170,
+            timestamp=timezone.make_aware(datetime.datetime(2024, 3, 2, 17, 31)),
+        )
+        Expenditure.objects.create(calories=2000, date=datetime.date(2024, 3, 8))
+        self.assertEqual(UserProfile.objects.get().adjustment, 3170)
+
+    def test_expenditure_save_updates_adjustment_once(self):
+        with CaptureQueriesContext(connection) as ctx:
+            Expenditure.objects.create(calories=2000, date=datetime.date(2024, 3, 1))
+        self.assertEqual(len(self._adjustment_updates(ctx.captured_queries)), 1)
+
+
+class UserProfileCacheTests(TestCase):
+    def setUp(self):
+        User.objects.create(username="tester")
+
+    def test_cached_profile_is_reused(self):
+        get_user_profile()
+        with self.assertNumQueries(0):
+            get_user_profile()
+
+    def test_adjustment_update_invalidates_cache(self):
+        UserProfile.objects.update(goal_daily_calorie_delta=-500)
+        self.assertEqual(get_user_profile().adjustment, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            update_remaining_calories_adjustment(datetime.date(2024, 3, 2))
+            self.assertEqual(get_user_profile().adjustment, 0)
+        self.assertEqual(get_user_profile().adjustment, 500)
+
+    def test_profile_save_invalidates_cache(self):
+        profile = get_user_profile()
+        profile.goal_daily_calorie_delta = -250
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertEqual(get_user_profile().goal_daily_calorie_delta, -250)
+
+
+class CumulativeCaloriesTests(TestCase):
+    def setUp(self):
+        User.objects.create(username="tester")
+
+    def assertCumulative(self, intake, expenditure):
+        profile = UserProfile.objects.get()
+        self.assertEqual(profile.cumulative_intake, intake)
+        self.assertEqual(profile.cumulative_expenditure, expenditure)
+
+    def test_create_update_delete(self):
+        intake = Intake.objects.create(label="apple", calories=95)
+        expenditure = Expenditure.objects.create(
+            calories=2000, date=datetime.date(2024, 3, 1)
+        )
+        self.assertCumulative(95, 2000)
+        intake.calories = 120
+        intake.save()
+        expenditure.calories = 2100
+        expenditure.save()
+        self.assertCumulative(120, 2100)
+        intake.delete()
+        self.assertCumulative(0, 2100)
+
+    def test_rebuild_command_reconciles_totals(self):
+        Intake.objects.create(label="apple", calories=95)
+        Intake.objects.update(calories=120)
+        call_command("rebuild_cumulative_calories", stdout=StringIO())
+        self.assertCumulative(120, 0)
+
+    def test_new_profile_starts_from_existing_history(self):
+        Intake.objects.create(label="apple", calories=95)
+        User.objects.all().delete()
+        User.objects.create(username="other")
+        self.assertCumulative(95, 0)
+
+
+class TodaysIntakesTests(TestCase):
+    def setUp(self):
+        User.objects.create(username="tester")
+
+    def test_rows_match_serializer_output(self):
+        intake = Intake.objects.create(
+            label="lunch",
+            calories=600,
+            timestamp=timezone.make_aware(datetime.datetime(2024, 3, 1, 12, 0, 0, 5)),
+        )
+        response = self.client.get(
+            reverse("intake-todays-intakes"), {"date": "2024-03-01"}
+        )
+        self.assertEqual(response.json(), [IntakeSerializer(intake).data])
+
+
+class DailyTotalsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create(username="tester")
+        Intake.objects.create(
+            label="lunch",
+            calories=600,
+            timestamp=timezone.make_aware(datetime.datetime(2024, 3, 1, 12)),
+        )
+
+    def test_daily_balances_served_from_cache(self):
+        self.client.get(reverse("daily-balances"))
+        # Only the data version is read.
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("daily-balances"))
+        self.assertEqual(response.json()[0]["total_intake"], 600)
+
+    def test_write_invalidates_cached_totals(self):
+        self.client.get(reverse("intake-daily-sums"))
+        Intake.objects.create(
+            label="dinner",
+            calories=400,
+            timestamp=timezone.make_aware(datetime.datetime(2024, 3, 1, 18)),
+        )
+        response = self.client.get(reverse("intake-daily-sums"))
+        self.assertEqual(response.json()[0]["total_calories"], 1000)
+
+    def test_version_is_stored_in_the_database(self):
+        version = get_data_version()
+        Intake.objects.create(label="snack", calories=200)
+        # Another worker's cache never saw the bump.
+        cache.clear()
+        self.assertEqual(get_data_version(), version + 1)
+
+    def test_unchanged_totals_return_not_modified(self):
+        etag = self.client.get(reverse("daily-balances"))["ETag"]
+        response = self.client.get(reverse("daily-balances"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Intake.objects.create(label="snack", calories=200)
+        response = self.client.get(reverse("daily-balances"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_follows_version_bumped_elsewhere(self):
+        etag = self.client.get(reverse("daily-balances"))["ETag"]
+        # As if another worker handled the write: only the database changes.
+        UserProfile.objects.update(data_version=F("data_version") + 1)
+        response = self.client.get(reverse("daily-balances"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_differs_per_rendered_format(self):
+        json_etag = self.client.get(reverse("daily-balances"))["ETag"]
+        response = self.client.get(
+            reverse("daily-balances"),
+            HTTP_ACCEPT="text/html",
+            HTTP_IF_NONE_MATCH=json_etag,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], json_etag)
+
+
+class MuteEnergySignalsTests(TestCase):
+    def setUp(self):
+        User.objects.create(username="tester")
+
+    def test_no_profile_updates_while_muted(self):
+        with mute_energy_signals():
+            with CaptureQueriesContext(connection) as ctx:
+                Intake.objects.create(label="apple", calories=95)
+                Expenditure.objects.create(
+                    calories=2000, date=datetime.date(2024, 3, 1)
+                )
+        self.assertFalse(
+            any("energy_userprofile" in q["sql"] for q in ctx.captured_queries)
+        )
+
+    def test_cumulative_totals_rebuilt_on_exit(self):
+        with self.captureOnCommitCallbacks(execute=True), mute_energy_signals():
+            Intake.objects.bulk_create(
+                [Intake(label="apple", calories=95), Intake(label="pear", calories=100)]
+            )
+        profile = UserProfile.objects.get()
+        self.assertEqual(profile.cumulative_intake, 195)
+
+    def test_cumulative_totals_rebuilt_when_block_raises(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), mute_energy_signals():
+                Intake.objects.create(label="apple", calories=500)
+                raise RuntimeError
+        self.assertEqual(UserProfile.objects.get().cumulative_intake, 500)
+
+    def test_error_inside_atomic_block_is_not_masked(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic(), mute_energy_signals():
+                Expenditure.objects.bulk_create(
+                    [
+                        Expenditure(calories=2000, date=datetime.date(2024, 3, 1)),
+                        Expenditure(calories=2100, date=datetime.date(2024, 3, 1)),
+                    ]
+                )
+        self.assertEqual(UserProfile.objects.get().cumulative_expenditure, 0)
+
+    def test_other_contexts_still_run_receivers(self):
+        with mute_energy_signals():
+            with CaptureQueriesContext(connection) as ctx:
+                # A fresh context stands in for a request thread.
+                contextvars.Context().run(
+                    Intake.objects.create, label="apple", calories=95
+                )
+        self.assertTrue(
+            any("energy_userprofile" in q["sql"] for q in ctx.captured_queries)
+        )
+
+    def test_receivers_run_again_after_block(self):
+        with mute_energy_signals():
+            pass
+        with CaptureQueriesContext(connection) as ctx:
+            Intake.objects.create(label="apple", calories=95)
+        self.assertTrue(
+            any("energy_userprofile" in q["sql"] for q in ctx.captured_queries)
+        )
@@ -1,55 +1,125 @@
 # energy/utils.py
 import datetime
+import logging
+from contextvars import ContextVar
 from datetime import timedelta
+from functools import lru_cache
 
 from django.apps import apps
-from django.db.models import Sum
-from django.db.models.functions import TruncDay
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Func, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncDay
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
+# Set by signals.mute_energy_signals(); context-local, so other threads and
+# tasks keep running the receivers.
+energy_signals_muted = ContextVar("energy_signals_muted", default=False)
+
+# zoneinfo zones are attached with replace(); no pytz-style localize() needed.
+_TZ = timezone.get_default_timezone()
+
+
+@lru_cache(maxsize=4096)
+def _day_bounds(date):
+    day_start = datetime.datetime(date.year, date.month, date.day, tzinfo=_TZ)
+    # Aware arithmetic is wall-clock, so this is the next local midnight even
+    # across a DST change.
+    return day_start, day_start + timedelta(days=1)
+
+
+DAILY_CALORIES_CHUNK_SIZE = 500
+
+
+@lru_cache(maxsize=None)
+def _models():
+    # Resolved lazily: energy.models imports this module.
+    return (
+        apps.get_model("energy", "Intake"),
+        apps.get_model("energy", "Expenditure"),
+        apps.get_model("energy", "UserProfile"),
+    )
+
 
 class DateRangeOperationsMixin:
     def get_date_from_request(self, request):
         date_str = request.query_params.get("date", None)
         if date_str is None:
             return timezone.localtime().date()
-        else:
-            date = timezone.datetime.strptime(date_str, "%Y-%m-%d").date()
-            if date is None:
-                raise ValueError("Invalid date format. Use YYYY-MM-DD.")
-            return date
-
-    def get_datetime_range_for_date(self, date):
-        datetime_start = timezone.make_aware(
-            datetime.datetime.combine(date, datetime.time.min)
-        )
-        datetime_end = timezone.make_aware(
-            datetime.datetime.combine(date, datetime.time.max)
-        )
-        return datetime_start, datetime_end
+        try:
+            return datetime.date.fromisoformat(date_str)
+        except ValueError:
+            raise ValueError("Invalid date format. Use YYYY-MM-DD.")
+
+    def get_day_bounds(self, date):
+        # Half-open [start, next_start): no 23:59:59.999999 edge to fall past.
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        return _day_bounds(date)
 
     def aggregate_calories_for_date_range(self, model, datetime_start, datetime_end):
         return (
-            model.objects.filter(
-                timestamp__range=(datetime_start, datetime_end)
+            model._default_manager.filter(
+                timestamp__gte=datetime_start, timestamp__lt=datetime_end
             ).aggregate(Sum("calories"))["calories__sum"]
             or 0
         )
 
+    def aggregate_calories_for_date(self, model, date):
+        day_start, next_day_start = self.get_day_bounds(date)
+        return self.aggregate_calories_for_date_range(model, day_start, next_day_start)
+
+    def get_expenditure_for_date(self, date):
+        _, Expenditure, _ = _models()
+        return (
+            Expenditure.objects.filter(date=date)
+            .values_list("calories", flat=True)
+            .first()
+            or 0
+        )
+
     def aggregate_daily_calories(self, queryset):
+        """
+        Return a values_list() QuerySet of (date, total_calories) tuples, one
+        per day. Callers rendering a full history should prefer
+        iter_daily_calories().
+        """
         return (
             queryset.annotate(date=TruncDay("timestamp"))
-            .values("date")
+            .values_list("date")
             .annotate(total_calories=Sum("calories"))
             .order_by("date")
         )
 
+    def aggregate_daily_balances(self):
+        Intake, Expenditure, _ = _models()
+        return (
+            Intake.objects.annotate(date=TruncDate("timestamp"))
+            .values("date")
+            .annotate(
+                total_intake=Sum("calories"),
+                total_expenditure=Coalesce(
+                    Subquery(
+                        Expenditure.objects.filter(date=OuterRef("date")).values(
+                            "calories"
+                        )
+                    ),
+                    0,
+                ),
+            )
+            .order_by("date")
+        )
+
+    def iter_daily_calories(self, queryset):
+        return self.aggregate_daily_calories(queryset).iterator(
+            chunk_size=DAILY_CALORIES_CHUNK_SIZE
+        )
+
     def get_adjusted_goal_for_date(self, date):
-        UserProfile = apps.get_model("energy", "UserProfile")
-        Expenditure = apps.get_model("energy", "Expenditure")
-        user_profile = UserProfile.objects.first()
-        expenditure_record = Expenditure.objects.filter(date=date).first()
-        total_expenditure = expenditure_record.calories if expenditure_record else 0
+        user_profile = get_user_profile()
+        total_expenditure = self.get_expenditure_for_date(date)
         adjusted_goal = (
             total_expenditure
             + user_profile.goal_daily_calorie_delta
@@ -60,46 +130,147 @@ class DateRangeOperationsMixin:
 
 date_range_ops = DateRangeOperationsMixin()
 
+USER_PROFILE_CACHE_KEY = "energy:user_profile"
+USER_PROFILE_CACHE_TIMEOUT = 300
+DAILY_TOTALS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_user_profile():
+    _, _, UserProfile = _models()
+    return cache.get_or_set(
+        USER_PROFILE_CACHE_KEY,
+        UserProfile.objects.only("id", "goal_daily_calorie_delta", "adjustment").first,
+        USER_PROFILE_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_user_profile_cache():
+    cache.delete(USER_PROFILE_CACHE_KEY)
+
+
+# Kept on the profile row rather than in the cache: the default cache is
+# per-process, so a cached counter would only be bumped in the writing worker.
+def get_data_version():
+    _, _, UserProfile = _models()
+    return UserProfile.objects.values_list("data_version", flat=True).first() or 0
+
+
+def bump_data_version():
+    _, _, UserProfile = _models()
+    UserProfile.objects.update(data_version=F("data_version") + 1)
+
+
+def make_version_key(name):
+    return f"energy:{name}:v{get_data_version()}"
+
+
+def aggregate_subquery(queryset, function, field):
+    return Subquery(queryset.order_by().values(value=Func(field, function=function)))
+
+
+def sum_calories_subquery(queryset):
+    return Coalesce(aggregate_subquery(queryset, "SUM", "calories"), 0)
+
+
+def compute_adjustment(total_intake, total_expenditure, goal_delta_per_day, num_days):
+    net_calorie_delta = total_expenditure - total_intake
+    goal_calorie_total = goal_delta_per_day * num_days
+    return abs(goal_calorie_total) - net_calorie_delta
+
+
+def record_calorie_change(model, calories_change):
+    Intake, _, UserProfile = _models()
+    field = "cumulative_intake" if model is Intake else "cumulative_expenditure"
+    UserProfile.objects.update(**{field: F(field) + calories_change})
+
+
+def rebuild_cumulative_calories():
+    Intake, Expenditure, UserProfile = _models()
+    UserProfile.objects.update(
+        cumulative_intake=sum_calories_subquery(Intake.objects.all()),
+        cumulative_expenditure=sum_calories_subquery(Expenditure.objects.all()),
+    )
+
 
 def update_remaining_calories_adjustment(date_input):
     if not isinstance(date_input, datetime.datetime):
         date_input = datetime.datetime.combine(date_input, datetime.datetime.min.time())
     if timezone.is_naive(date_input):
-        date_input = timezone.make_aware(date_input, timezone.get_default_timezone())
-    Intake = apps.get_model("energy", "Intake")
-    Expenditure = apps.get_model("energy", "Expenditure")
-    UserProfile = apps.get_model("energy", "UserProfile")
-    user_profile = UserProfile.objects.first()
-    goal_delta_per_day = user_profile.goal_daily_calorie_delta
-    earliest_intake_record = Intake.objects.order_by("timestamp").first()
-    earliest_expenditure_record = Expenditure.objects.order_by("date").first()
-    if earliest_intake_record and earliest_expenditure_record:
-        earliest_date = min(
-            earliest_intake_record.timestamp.date(),
-            earliest_expenditure_record.date
+        date_input = date_input.replace(tzinfo=_TZ)
+    Intake, Expenditure, UserProfile = _models()
+    day_start, _ = date_range_ops.get_day_bounds(date_input)
+    with transaction.atomic():
+        # The cumulative totals cover all history, so the rows on or after
+        # date_input are summed in the same read and taken back out below.
+        user_profile = (
+            UserProfile.objects.select_for_update()
+            .annotate(
+                earliest_intake=aggregate_subquery(
+                    Intake.objects.all(), "MIN", "timestamp"
+                ),
+                earliest_expenditure=aggregate_subquery(
+                    Expenditure.objects.all(), "MIN", "date"
+                ),
+                later_intake=sum_calories_subquery(
+                    Intake.objects.filter(timestamp__gte=day_start)
+                ),
+                later_expenditure=sum_calories_subquery(
+                    Expenditure.objects.filter(date__gte=date_input.date())
+                ),
+            )
+            .values(
+                "pk",
+                "goal_daily_calorie_delta",
+                "cumulative_intake",
+                "cumulative_expenditure",
+                "earliest_intake",
+                "earliest_expenditure",
+                "later_intake",
+                "later_expenditure",
+            )
+            .first()
         )
-    else:
-        earliest_date = date_input.date() - datetime.timedelta(days=1)
-    start_date = timezone.make_aware(
-        datetime.datetime.combine(earliest_date, datetime.datetime.min.time()),
-        timezone.get_default_timezone()
-    )
-    datetime_start, _ = date_range_ops.get_datetime_range_for_date(start_date)
-    _, datetime_end = date_range_ops.get_datetime_range_for_date(
-        date_input - datetime.timedelta(days=1)
-    )
-    total_intake = date_range_ops.aggregate_calories_for_date_range(
-        Intake, datetime_start, datetime_end
-    )
-    total_expenditure = (
-            Expenditure.objects.filter(
-                date__range=[start_date, date_input - datetime.timedelta(days=1)]
-            ).aggregate(Sum("calories"))["calories__sum"]
-            or 0
-    )
-    net_calorie_delta = total_expenditure - total_intake
-    num_days = (date_input.date() - start_date.date()).days
-    goal_calorie_total = goal_delta_per_day * num_days
-    adjustment_needed = abs(goal_calorie_total) - net_calorie_delta
-    user_profile.adjustment = adjustment_needed
-    user_profile.save()
+        goal_delta_per_day = user_profile["goal_daily_calorie_delta"]
+        earliest_intake = user_profile["earliest_intake"]
+        earliest_expenditure = user_profile["earliest_expenditure"]
+        profile_qs = UserProfile.objects.filter(pk=user_profile["pk"])
+        if earliest_intake and earliest_expenditure:
+            earliest_date = min(
+                timezone.localtime(earliest_intake).date(), earliest_expenditure
+            )
+            total_intake = (
+                user_profile["cumulative_intake"] - user_profile["later_intake"]
+            )
+            total_expenditure = (
+                user_profile["cumulative_expenditure"]
+                - user_profile["later_expenditure"]
+            )
+        else:
+            earliest_date = date_input.date() - datetime.timedelta(days=1)
+            prev_day_start, _ = date_range_ops.get_day_bounds(earliest_date)
+            totals = profile_qs.values(
+                intake=sum_calories_subquery(
+                    Intake.objects.filter(
+                        timestamp__gte=prev_day_start, timestamp__lt=day_start
+                    )
+                ),
+                expenditure=sum_calories_subquery(
+                    Expenditure.objects.filter(date=earliest_date)
+                ),
+            ).get()
+            total_intake = totals["intake"]
+            total_expenditure = totals["expenditure"]
+        num_days = (date_input.date() - earliest_date).days
+        adjustment_needed = compute_adjustment(
+            total_intake, total_expenditure, goal_delta_per_day, num_days
+        )
+        logger.debug(
+            "adjustment for %s: intake=%s expenditure=%s days=%s adjustment=%s",
+            date_input.date(),
+            total_intake,
+            total_expenditure,
+            num_days,
+            adjustment_needed,
+        )
+        profile_qs.update(adjustment=adjustment_needed)
+    transaction.on_commit(invalidate_user_profile_cache)
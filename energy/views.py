@@ -1,25 +1,52 @@
 # energy/views.py
 
-from django.apps import apps
-from django.db.models import Sum
-from django.db.models.functions import TruncDay
+from django.core.cache import cache
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework import viewsets
 from rest_framework.decorators import action, api_view
+from rest_framework.fields import CharField, IntegerField
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from .models import Expenditure, Intake, UserProfile, Weight
+from .pagination import DateCursorPagination, TimestampCursorPagination
 from .serializers import (
     ExpenditureSerializer,
     IntakeSerializer,
     WeightSerializer,
 )
-from .utils import DateRangeOperationsMixin
+from .utils import (
+    DAILY_CALORIES_CHUNK_SIZE,
+    DAILY_TOTALS_CACHE_TIMEOUT,
+    DateRangeOperationsMixin,
+    get_user_profile,
+    make_version_key,
+)
+
+
+def get_version_key(request, name):
+    # The data version is a database read; do it once per request so the ETag
+    # and the cache lookup share it.
+    if not hasattr(request, "_version_key"):
+        request._version_key = make_version_key(name)
+    return request._version_key
+
+
+def data_version_etag(name):
+    # Same version as the cached rows, so a 304 costs one single-row read and
+    # every worker agrees on it. The negotiated format keeps JSON and
+    # browsable-API bodies apart.
+    def etag_func(request, *args, **kwargs):
+        return f"{get_version_key(request, name)}:{request.accepted_renderer.format}"
+
+    return method_decorator(condition(etag_func=etag_func))
 
 
 class IntakeViewSet(viewsets.ModelViewSet, DateRangeOperationsMixin):
     queryset = Intake.objects.all()
     serializer_class = IntakeSerializer
+    pagination_class = TimestampCursorPagination
 
     @action(detail=False, methods=["get"])
     def daily_sum(self, request):
@@ -27,43 +54,67 @@ class IntakeViewSet(viewsets.ModelViewSet, DateRangeOperationsMixin):
             date = self.get_date_from_request(request)
         except ValueError as e:
             return Response({"error": str(e)}, status=400)
-        datetime_start, datetime_end = self.get_datetime_range_for_date(date)
-        sum_calories = self.aggregate_calories_for_date_range(
-            self.queryset.model, datetime_start, datetime_end
-        )
+        sum_calories = self.aggregate_calories_for_date(self.get_queryset().model, date)
         return Response({"date": date.isoformat(), "total_calories": sum_calories})
 
     @action(detail=False, methods=["get"])
+    @data_version_etag("daily_sums")
     def daily_sums(self, request):
-        daily_calories = self.aggregate_daily_calories(self.queryset)
-        data = [
-            {"date": item["date"].isoformat(), "total_calories": item["total_calories"]}
-            for item in daily_calories
-        ]
+        data = cache.get_or_set(
+            get_version_key(request, "daily_sums"),
+            self.get_daily_sums_data,
+            DAILY_TOTALS_CACHE_TIMEOUT,
+        )
         return Response(data)
 
+    def get_daily_sums_data(self):
+        daily_calories = self.iter_daily_calories(self.get_queryset())
+        return [
+            {"date": date, "total_calories": total_calories}
+            for date, total_calories in daily_calories
+        ]
+
     @action(detail=False, methods=["get"])
     def todays_intakes(self, request):
         try:
             date = self.get_date_from_request(request)
         except ValueError as e:
             return Response({"error": str(e)}, status=400)
-        datetime_start, datetime_end = self.get_datetime_range_for_date(date)
-        todays_intakes = self.queryset.filter(
-            timestamp__range=(datetime_start, datetime_end)
+        day_start, next_day_start = self.get_day_bounds(date)
+        fields = {
+            name: field
+            for name, field in self.get_serializer().fields.items()
+            if not field.write_only
+        }
+        # values() already yields plain ints and strings; anything else (e.g.
+        # datetimes) goes through its serializer field, as in the list view.
+        converters = [
+            (name, field)
+            for name, field in fields.items()
+            if not isinstance(field, (CharField, IntegerField))
+        ]
+        todays_intakes = list(
+            self.get_queryset()
+            .filter(timestamp__gte=day_start, timestamp__lt=next_day_start)
+            .values(*fields)
         )
-        serializer = self.get_serializer(todays_intakes, many=True)
-        return Response(serializer.data)
+        for intake in todays_intakes:
+            for name, field in converters:
+                if intake[name] is not None:
+                    intake[name] = field.to_representation(intake[name])
+        return Response(todays_intakes)
 
 
 class ExpenditureViewSet(viewsets.ModelViewSet):
     queryset = Expenditure.objects.all()
     serializer_class = ExpenditureSerializer
+    pagination_class = DateCursorPagination
 
 
 class WeightViewSet(viewsets.ModelViewSet):
     queryset = Weight.objects.all()
     serializer_class = WeightSerializer
+    pagination_class = TimestampCursorPagination
 
 
 class DailyBalanceView(APIView, DateRangeOperationsMixin):
@@ -72,12 +123,8 @@ class DailyBalanceView(APIView, DateRangeOperationsMixin):
             date = self.get_date_from_request(request)
         except ValueError as e:
             return Response({"error": str(e)}, status=400)
-        datetime_start, datetime_end = self.get_datetime_range_for_date(date)
-        total_intake = self.aggregate_calories_for_date_range(
-            Intake, datetime_start, datetime_end
-        )
-        expenditure_record = Expenditure.objects.filter(date=date).first()
-        total_expenditure = expenditure_record.calories if expenditure_record else 0
+        total_intake = self.aggregate_calories_for_date(Intake, date)
+        total_expenditure = self.get_expenditure_for_date(date)
         balance = total_intake - total_expenditure
         return Response(
             {
@@ -90,35 +137,33 @@ class DailyBalanceView(APIView, DateRangeOperationsMixin):
 
 
 class DailyBalancesView(APIView, DateRangeOperationsMixin):
+    @data_version_etag("daily_balances")
     def get(self, request):
-        daily_intakes = (
-            self.aggregate_daily_calories(Intake.objects.all())
-            .annotate(date_only=TruncDay("date"))
-            .order_by("date_only")
+        balances_data = cache.get_or_set(
+            get_version_key(request, "daily_balances"),
+            self.get_balances_data,
+            DAILY_TOTALS_CACHE_TIMEOUT,
         )
-        daily_expenditures = (
-            Expenditure.objects.values("date")
-            .annotate(total_expenditure=Sum("calories"))
-            .order_by("date")
+        return Response(balances_data)
+
+    def get_balances_data(self):
+        daily_balances = self.aggregate_daily_balances().iterator(
+            chunk_size=DAILY_CALORIES_CHUNK_SIZE
         )
-        expenditures_dict = {
-            item["date"]: item["total_expenditure"] for item in daily_expenditures
-        }
         balances_data = []
-        for intake in daily_intakes:
-            date = intake["date"].date()
-            total_intake = intake["total_calories"]
-            total_expenditure = expenditures_dict.get(date, 0)
+        for day in daily_balances:
+            total_intake = day["total_intake"]
+            total_expenditure = day["total_expenditure"]
             balance = total_intake - total_expenditure
             balances_data.append(
                 {
-                    "date": date.isoformat(),
+                    "date": day["date"],
                     "total_intake": total_intake,
                     "total_expenditure": total_expenditure,
                     "balance": balance,
                 }
             )
-        return Response(balances_data)
+        return balances_data
 
 
 date_range_ops = DateRangeOperationsMixin()
@@ -130,17 +175,11 @@ def daily_summary(request):
         date = date_range_ops.get_date_from_request(request)
     except ValueError as e:
         return Response({"error": str(e)}, status=400)
-    datetime_start, datetime_end = date_range_ops.get_datetime_range_for_date(date)
-    Intake = apps.get_model("energy", "Intake")
-    Expenditure = apps.get_model("energy", "Expenditure")
-    UserProfile = apps.get_model("energy", "UserProfile")
 
     # get all the data
-    total_intake = date_range_ops.aggregate_calories_for_date_range(
-        Intake, datetime_start, datetime_end
-    )
-    total_expenditure = Expenditure.objects.filter(date=date).first().calories
-    user_profile = UserProfile.objects.first()
+    total_intake = date_range_ops.aggregate_calories_for_date(Intake, date)
+    total_expenditure = date_range_ops.get_expenditure_for_date(date)
+    user_profile = get_user_profile()
     initial_goal = user_profile.goal_daily_calorie_delta
     adjustment = user_profile.adjustment
 